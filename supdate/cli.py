@@ -1,11 +1,14 @@
-import compileall
-import json
+import marshal
 import os
-import shutil
-import tempfile
-import zipapp
+import stat
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from functools import cached_property
+from hashlib import sha1
+from importlib.util import MAGIC_NUMBER
 from pathlib import Path
 from typing import TYPE_CHECKING, Optional
 from urllib.parse import urljoin
@@ -17,14 +20,23 @@ from click import Group as Cli
 
 from .index import IndexPackage, IndexPackageManifest, Launcher
 from .package import Package, PackageBuilder
+from .profile import Profile
 from .providers.base import Provider
 from .providers.fabric import FabricProvider
 from .providers.forge import ForgeProvider
-from .utils import sha1_hexdigest
+from .utils import (
+    HashCache,
+    atomic_write_bytes,
+    iter_files,
+    json_dumps,
+    json_loads,
+)
 from .versions import calc_next_version
 
 DOMAIN = "myang2.com"
 
+DEFAULT_EXCLUSION_JSON = b'{"exclude": ["config/Chikachi/**/*"]}\n'
+
 
 class ClickPath(click.Path):
     def coerce_path_result(self, rv):
@@ -47,8 +59,16 @@ class SUpdate:
         self.libraries_url = self.libraries_url.rstrip("/")
         self.packages_url = self.packages_url.rstrip("/")
         self.current_datetime = datetime.now().strftime("%Y-%m-%dT%H:%M:%S+0000")
-        self.fabric_provider = FabricProvider()
-        self.forge_provider = ForgeProvider(
+        # (instance path, version, force build) -> (profile path, profile)
+        self.profiles: dict[tuple, tuple[Path, Profile]] = {}
+
+    @cached_property
+    def fabric_provider(self) -> FabricProvider:
+        return FabricProvider()
+
+    @cached_property
+    def forge_provider(self) -> ForgeProvider:
+        return ForgeProvider(
             forge_path=self.forge_path,
             libraries_path=self.libraries_path,
             libraries_url=self.libraries_url,
@@ -58,6 +78,11 @@ class SUpdate:
     def index_path(self):
         return self.packages_path / "index.json"
 
+    @property
+    def update_cache_path(self):
+        # not beside index.json: the packages folder is published as is
+        return self.instances_path / ".supdate-cache.json"
+
     def cmd_package(
         self,
         name: str,
@@ -68,6 +93,9 @@ class SUpdate:
         instance_path = self.instances_path / name
         package_path = self.packages_path / name
         modpack_path = package_path / "modpack.json"
+        # beside exclude.json: the package folder is published, and the keys are
+        # absolute local paths
+        hashes_path = instance_path / ".supdate-hashes.json"
         client_path = instance_path / "client"
 
         if not instance_path.exists():
@@ -81,7 +109,7 @@ class SUpdate:
             Package.read_from_path(modpack_path) if modpack_path.exists() else None
         )
 
-        _, provider_profile = self.provider.auto_profile(
+        _, provider_profile = self.auto_profile(
             instance_path=instance_path,
             version=version,
             force_build=force_build,
@@ -96,8 +124,9 @@ class SUpdate:
         assert not self.packages_url.endswith("/")
         package_url = f"{self.packages_url}/{name}/"
 
+        hashes = HashCache.read_from_path(hashes_path)
         package_builder = PackageBuilder(
-            package, instance_path, package_path, package_url
+            package, instance_path, package_path, package_url, hashes
         )
         package_builder.include("mods/**/*")
         package_builder.include("config/**/*")
@@ -110,16 +139,10 @@ class SUpdate:
         exclusion_json = instance_path / "exclude.json"
         exclusion_key = "exclude"
         if not exclusion_json.exists():
-            default_exclusion = {
-                exclusion_key: [
-                    "config/Chikachi/**/*",
-                ]
-            }
-            exclusion_json.write_text(json.dumps(default_exclusion))
+            exclusion_json.write_bytes(DEFAULT_EXCLUSION_JSON)
 
         try:
-            with exclusion_json.open() as json_file:
-                exclusion = json.load(json_file)
+            exclusion = json_loads(exclusion_json.read_bytes())
 
             if exclusion_key in exclusion and isinstance(
                 exclusion[exclusion_key], list
@@ -130,19 +153,37 @@ class SUpdate:
         except ValueError as err:
             raise Exception("Fatal error occurred from exclude.json") from err
 
-        package_builder.build()
-
         client_builder = PackageBuilder(package, client_path, package_path, package_url)
         client_builder.include("**/*")
-        client_builder.build()
+
+        # copy and hash both trees in a single pass
+        package_builder.build(client_builder)
 
         modpack_path.parent.mkdir(exist_ok=True)
         package.write_to_path(modpack_path)
+        hashes.write_to_path(hashes_path)
 
         self.cmd_update()
 
         return modpack_path
 
+    def auto_profile(
+        self,
+        instance_path: Path,
+        version: Optional[str] = None,
+        *,
+        force_build: bool = False,
+    ) -> tuple[Path, Profile]:
+        key = (str(instance_path), version, bool(force_build))
+        if key not in self.profiles:
+            self.profiles[key] = self.provider.auto_profile(
+                instance_path=instance_path,
+                version=version,
+                force_build=force_build,
+            )
+
+        return self.profiles[key]
+
     def cmd_update(self) -> Path:
         index_path = self.index_path
 
@@ -156,41 +197,103 @@ class SUpdate:
             launcher=prev_manifest.launcher,
         )
 
-        for package_path in self.packages_path.iterdir():
-            if not package_path.is_dir():
-                continue
+        # package name -> {id, mtime_ns, size, sha1} of modpack.json
+        prev_cache = self.read_update_cache()
+        cache = {}
 
-            package_name = package_path.name
-            modpack_path = package_path / "modpack.json"
-            if not modpack_path.exists():
-                print(package_name, "missing", "modpack.json")
-                continue
+        with os.scandir(self.packages_path) as it:
+            entries = [entry for entry in it if entry.is_dir()]
 
-            package = Package.read_from_path(modpack_path)
-
-            prev_index_package = (
-                prev_manifest.packages.get(package.id) if prev_manifest else None
+        # hashing and file I/O release the GIL, so packages are processed in parallel
+        with ThreadPoolExecutor() as executor:
+            results = executor.map(
+                lambda entry: self.update_package(
+                    entry, prev_manifest, prev_cache, next_version, next_datetime
+                ),
+                entries,
             )
-            if prev_index_package and prev_index_package.sha1 == sha1_hexdigest(
-                modpack_path
-            ):
-                index_package = prev_index_package
-            else:
-                package.version = next_version
-                package.time = next_datetime
-                package.write_to_path(modpack_path)
-
-                index_package = IndexPackage.from_package(
-                    package=package,
-                    modpack_path=modpack_path,
-                    package_url=urljoin(self.packages_url, f"{package_path.name}/"),
-                )
 
-            manifest.packages[package.id] = index_package
+            for entry, result in zip(entries, results):
+                if result is None:
+                    continue
+
+                index_package, cached = result
+                manifest.packages[cached["id"]] = index_package
+                cache[entry.name] = cached
 
         manifest.write_to_path(index_path)
+        self.write_update_cache(cache)
         return index_path
 
+    def update_package(
+        self,
+        entry: os.DirEntry,
+        prev_manifest: IndexPackageManifest,
+        prev_cache: dict,
+        next_version: str,
+        next_datetime: str,
+    ) -> Optional[tuple[IndexPackage, dict]]:
+        package_name = entry.name
+        modpack_path = Path(entry.path, "modpack.json")
+        try:
+            st = modpack_path.stat()
+        except FileNotFoundError:
+            print(package_name, "missing", "modpack.json")
+            return None
+
+        # skip hashing and parsing when modpack.json is untouched since last run
+        cached = prev_cache.get(package_name)
+        if (
+            cached is not None
+            and cached["mtime_ns"] == st.st_mtime_ns
+            and cached["size"] == st.st_size
+        ):
+            prev_index_package = prev_manifest.packages.get(cached["id"])
+            if prev_index_package and prev_index_package.sha1 == cached["sha1"]:
+                return prev_index_package, cached
+
+        # read once, then parse and hash the same bytes
+        data = modpack_path.read_bytes()
+        package = Package.from_json(json_loads(data))
+
+        prev_index_package = (
+            prev_manifest.packages.get(package.id) if prev_manifest else None
+        )
+        if prev_index_package and prev_index_package.sha1 == sha1(data).hexdigest():
+            index_package = prev_index_package
+        else:
+            package.version = next_version
+            package.time = next_datetime
+
+            next_data = package.dumps()
+            if next_data != data:
+                atomic_write_bytes(modpack_path, next_data)
+
+            index_package = IndexPackage.from_package(
+                package=package,
+                modpack_path=modpack_path,
+                package_url=urljoin(self.packages_url, f"{package_name}/"),
+                data=next_data,
+            )
+
+        st = modpack_path.stat()
+        return index_package, {
+            "id": package.id,
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "sha1": index_package.sha1,
+        }
+
+    def read_update_cache(self) -> dict:
+        try:
+            return json_loads(self.update_cache_path.read_bytes())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def write_update_cache(self, cache: dict):
+        self.update_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(self.update_cache_path, json_dumps(cache))
+
     def get_latest_manifest(self) -> IndexPackageManifest:
         if self.index_path.exists():
             return IndexPackageManifest.read_from_path(self.index_path)
@@ -282,10 +385,10 @@ def cli(
         libraries_url=libraries_url,
     )
 
-    ctx.obj.provider = {
-        "fabric": ctx.obj.fabric_provider,
-        "forge": ctx.obj.forge_provider,
-    }.get(provider)
+    if provider == "fabric":
+        ctx.obj.provider = ctx.obj.fabric_provider
+    elif provider == "forge":
+        ctx.obj.provider = ctx.obj.forge_provider
 
     if use_requests_cache:
         requests_cache.install_cache(".supdate")
@@ -299,7 +402,7 @@ if TYPE_CHECKING:
 @click.argument("version")
 @click.pass_obj
 def cli_build_profile(supdate: SUpdate, version: str):
-    profile_path, profile = supdate.provider.auto_profile(
+    profile_path, profile = supdate.auto_profile(
         instance_path=supdate.instances_path,
         version=version,
         force_build=True,
@@ -340,27 +443,31 @@ def cli_build_pyz():
         raise Exception("can't packaging because already packaged")
 
     folder = this.parent
-    target_folder = Path(tempfile.mkdtemp())
-
-    shutil.copytree(folder, target_folder / folder.name)
-    (target_folder / folder.name / "__main__.py").rename(target_folder / "__main__.py")
-
-    compileall.compile_dir(target_folder, legacy=True)
-
-    def filter_func(file: Path):
-        if "__pycache__" in file.parts:
-            return False
-
-        return file.suffix == ".pyc"
-
     pyz_path = folder.with_suffix(".pyz")
 
-    zipapp.create_archive(
-        target_folder,
-        pyz_path,
-        "/usr/bin/env python3.11",
-        filter=filter_func,
-    )
+    # compile straight into the archive, with __main__.py moved to the root
+    with pyz_path.open("wb") as fp:
+        fp.write(b"#!/usr/bin/env python3.11\n")
+
+        with zipfile.ZipFile(fp, "w") as zf:
+            for file, path in iter_files(folder):
+                if not path.endswith(".py"):
+                    continue
+
+                if path == "__main__.py":
+                    arcname = path
+                else:
+                    arcname = f"{folder.name}/{path}"
+
+                source = file.read_bytes()
+                code = compile(source, arcname, "exec", dont_inherit=True)
+                header = MAGIC_NUMBER + struct.pack(
+                    "<3L",
+                    0,
+                    int(file.stat().st_mtime) & 0xFFFFFFFF,
+                    len(source) & 0xFFFFFFFF,
+                )
+                zf.writestr(f"{arcname}c", header + marshal.dumps(code))
 
-    shutil.rmtree(target_folder)
+    pyz_path.chmod(pyz_path.stat().st_mode | stat.S_IEXEC)
     print(pyz_path)
@@ -1,6 +1,7 @@
 from dataclasses import dataclass, field
+from hashlib import sha1 as _sha1
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
 from .package import Package
 from .typed import Namespace
@@ -18,9 +19,20 @@ class IndexPackage(Namespace):
     size: int
 
     @classmethod
-    def from_package(cls, package: Package, modpack_path: Path, package_url: str):
+    def from_package(
+        cls,
+        package: Package,
+        modpack_path: Path,
+        package_url: str,
+        data: Optional[bytes] = None,
+    ):
         assert modpack_path.name == "modpack.json", modpack_path
-        st = modpack_path.stat()
+
+        # data is the content just written to modpack_path, if the caller has it
+        if data is not None:
+            sha1, size = _sha1(data).hexdigest(), len(data)
+        else:
+            sha1, size = sha1_hexdigest(modpack_path), modpack_path.stat().st_size
 
         return cls(
             name=package.name,
@@ -28,8 +40,8 @@ class IndexPackage(Namespace):
             time=package.time,
             url=package_url,
             path="modpack.json",
-            sha1=sha1_hexdigest(modpack_path),
-            size=st.st_size,
+            sha1=sha1,
+            size=size,
         )
 
 
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-import shutil
+import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Dict, List, Optional
@@ -8,7 +9,13 @@ from urllib.parse import quote, urljoin
 
 from .profile import Profile
 from .typed import Namespace
-from .utils import is_same_file, sha1_hexdigest
+from .utils import (
+    HashCache,
+    compile_globs,
+    copy_file,
+    glob_roots,
+    iter_files,
+)
 
 
 @dataclass
@@ -57,44 +64,78 @@ class PackageBuilder:
         instance_folder: Path,
         package_folder: Path,
         package_url: str,
+        hashes: Optional[HashCache] = None,
     ):
         self.package = package
         self.instance_folder = instance_folder
         self.package_folder = package_folder
         self.package_url = package_url
+        # quoted paths appended to this equal urljoin(package_url, path)
+        self.base_url = urljoin(package_url, ".")
+        self.config = PackageConfig()
         self.files: Dict[Path, Any] = {}
+        self.hashes = hashes if hashes is not None else HashCache()
 
-    def scan(self, pattern: str, folder: Optional[Path] = None):
-        if folder is None:
-            folder = self.instance_folder
+    def scan(self):
+        includes = compile_globs(self.config.includes)
+        excludes = compile_globs(self.config.excludes)
 
-        for file in folder.glob(pattern):
-            if file.is_file():
-                yield file, file.relative_to(folder)
+        # only descend into the literal directories the include patterns start with
+        for root in glob_roots(self.config.includes):
+            if not (self.instance_folder / root).is_dir():
+                continue
 
-    def include(self, pattern: str, folder: Optional[Path] = None):
-        for file, path in self.scan(pattern, folder=folder):
-            self.files[path] = file
+            for file, path in iter_files(self.instance_folder, root):
+                if includes.match(path) and not excludes.match(path):
+                    yield file, Path(path)
 
-    def exclude(self, pattern: str, folder: Optional[Path] = None):
-        for _, path in self.scan(pattern, folder=folder):
-            self.files.pop(path, None)
+    def include(self, pattern: str):
+        self.config.includes.append(pattern)
+
+    def exclude(self, pattern: str):
+        self.config.excludes.append(pattern)
+
+    def plan(self) -> Dict[Path, Path]:
+        return {path: file for file, path in self.scan()}
+
+    def build(self, *others: PackageBuilder):
+        # files of later builders win when they map to the same package path
+        for builder in (self, *others):
+            self.files.update(builder.plan())
 
-    def build(self):
         # TODO: delete mismatch
-        for path, file in self.files.items():
-            target_file = self.package_folder / path
-            target_file.parent.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor() as executor:
+            self.package.files.extend(
+                executor.map(self.build_file, self.files.keys(), self.files.values())
+            )
 
-            if not is_same_file(file, target_file):
-                shutil.copyfile(str(file), str(target_file))
-
-            file_stat = file.stat()
-            self.package.files.append(
-                PackageFile(
-                    size=file_stat.st_size,
-                    sha1=sha1_hexdigest(file),
-                    path=path.as_posix(),
-                    url=urljoin(self.package_url, quote(path.as_posix(), safe="/+'")),
-                )
+    def build_file(self, path: Path, file: Path) -> PackageFile:
+        file_stat = file.stat()
+        file_sha1 = self.hashes.sha1_hexdigest(file, file_stat)
+
+        # the source is stat'ed and hashed once, for the comparison and the entry
+        target_file = self.package_folder / path
+        try:
+            target_stat = target_file.stat()
+        except FileNotFoundError:
+            target_stat = None
+
+        # the target is only hashed when its size cannot tell it apart
+        if (
+            target_stat is None
+            or target_stat.st_size != file_stat.st_size
+            or (
+                not os.path.samestat(target_stat, file_stat)
+                and self.hashes.sha1_hexdigest(target_file, target_stat) != file_sha1
             )
+        ):
+            target_file.parent.mkdir(parents=True, exist_ok=True)
+            copy_file(file, target_file)
+            self.hashes.update(target_file, file_sha1)
+
+        return PackageFile(
+            size=file_stat.st_size,
+            sha1=file_sha1,
+            path=path.as_posix(),
+            url=self.base_url + quote(path.as_posix(), safe="/+'"),
+        )
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import posixpath
 from dataclasses import dataclass, field
+from functools import lru_cache
 from itertools import chain
 from pathlib import Path
 from typing import Any, List, NamedTuple, Optional
@@ -96,6 +97,21 @@ class LibraryTextDependency(LibraryDependency):
     suffix = ".txt"
 
 
+# the same coordinates show up in every profile that is loaded and merged;
+# dependencies are immutable tuples, so libraries can share them
+@lru_cache(maxsize=4096)
+def parse_library_name(name: str) -> LibraryDependency:
+    match name.count(":"):
+        case 2:
+            group, artifact, version = name.split(":")
+            return LibraryDependency(group, artifact, version)
+        case 3:
+            group, artifact, version, tag = name.split(":")
+            return LibraryDependency(group, artifact, version, tag)
+        case _:
+            raise ValueError(f"Invalid library name: {name}")
+
+
 @dataclass(repr=False)
 class Library(Namespace):
     name: str
@@ -111,17 +127,7 @@ class Library(Namespace):
 
     def __post_init__(self):
         if self._dependency is None:
-            match self.name.count(":"):
-                case 2:
-                    group, artifact, version = self.name.split(":")
-                    dependency = LibraryDependency(group, artifact, version)
-                case 3:
-                    group, artifact, version, tag = self.name.split(":")
-                    dependency = LibraryDependency(group, artifact, version, tag)
-                case _:
-                    raise ValueError(f"Invalid library name: {self.name}")
-
-            self._dependency = dependency
+            self._dependency = parse_library_name(self.name)
 
     @property
     def group(self) -> str:
@@ -141,7 +147,12 @@ class Library(Namespace):
 
     @property
     def path(self) -> Path:
-        return self._dependency.as_path()
+        # computed on first use; "_" keeps it out of to_json like _dependency
+        path = self.__dict__.get("_path")
+        if path is None:
+            path = self.__dict__["_path"] = self._dependency.as_path()
+
+        return path
 
 
 @dataclass(repr=False)
@@ -1,12 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 from pathlib import Path
 from typing import Optional
 from urllib.parse import urljoin
 
 import requests
-from pydantic import BaseModel, parse_obj_as
+from pydantic import BaseModel, TypeAdapter
 
 from supdate.profile import Library, LibraryArtifactDownload, LibraryDownloads, Profile
 from supdate.providers.base import Provider
+from supdate.utils import http_session
 from supdate.vanilla import fetch_vanilla_profile
 
 
@@ -133,30 +136,36 @@ class FabricCompatibleLoader(BaseModel):
     launcherMeta: dict
 
 
+# TypeAdapter builds its validator up front; parse_obj_as rebuilt one on every call
+@cache
+def get_type_adapter(tp) -> TypeAdapter:
+    return TypeAdapter(tp)
+
+
 class FabricMetaClient:
     URL = "https://meta.fabricmc.net"
 
     def __init__(self):
-        self.session = requests.session()
+        self.session = http_session()
 
     def get(self, path):
         return self.session.get(urljoin(self.URL, path)).json()
 
     def list_versions(self) -> list[dict]:
         data = self.get("/v2/versions")
-        return parse_obj_as(list[dict], data)
+        return get_type_adapter(list[dict]).validate_python(data)
 
     def list_game_versions(self) -> list[FabricGame]:
         data = self.get("/v2/versions/game")
-        return parse_obj_as(list[FabricGame], data)
+        return get_type_adapter(list[FabricGame]).validate_python(data)
 
     def list_game_versions_for_yarn(self) -> list[FabricGame]:
         data = self.get("/v2/versions/game/yarn")
-        return parse_obj_as(list[FabricGame], data)
+        return get_type_adapter(list[FabricGame]).validate_python(data)
 
     def list_game_versions_for_intermediary(self) -> list[FabricGame]:
         data = self.get("/v2/versions/game/intermediary")
-        return parse_obj_as(list[FabricGame], data)
+        return get_type_adapter(list[FabricGame]).validate_python(data)
 
     def list_intermediary_versions(
         self, *, game_version: Optional[str] = None
@@ -166,7 +175,7 @@ class FabricMetaClient:
         else:
             data = self.get("/v2/versions/intermediary")
 
-        return parse_obj_as(list[FabricIntermediary], data)
+        return get_type_adapter(list[FabricIntermediary]).validate_python(data)
 
     def get_intermediary_version(self, *, game_version: str) -> FabricIntermediary:
         intermediary_list = self.list_intermediary_versions(game_version)
@@ -185,31 +194,31 @@ class FabricMetaClient:
         else:
             data = self.get("/v2/versions/yarn")
 
-        return parse_obj_as(list[FabricYarn], data)
+        return get_type_adapter(list[FabricYarn]).validate_python(data)
 
     def list_loader_versions(self) -> list[FabricLoader]:
         data = self.get("/v2/versions/loader")
-        return parse_obj_as(list[FabricLoader], data)
+        return get_type_adapter(list[FabricLoader]).validate_python(data)
 
     def list_compatible_loaders(
         self, *, game_version: Optional[str] = None
     ) -> list[FabricCompatibleLoader]:
         data = self.get(f"/v2/versions/loader/{game_version}")
-        return parse_obj_as(list[FabricCompatibleLoader], data)
+        return get_type_adapter(list[FabricCompatibleLoader]).validate_python(data)
 
     def get_loader_version(
         self, *, game_version: str, loader_version: str
     ) -> FabricLoader:
         data = self.get(f"/v2/versions/loader/{game_version}/{loader_version}")
 
-        return parse_obj_as(FabricLoader, data)
+        return get_type_adapter(FabricLoader).validate_python(data)
 
     def get_loader_profile_json(self, *, game_version: str, loader_version: str):
         data = self.get(
             f"/v2/versions/loader/{game_version}/{loader_version}/profile/json"
         )
 
-        return parse_obj_as(dict, data)
+        return get_type_adapter(dict).validate_python(data)
 
     def get_loader_profile_zip(
         self, *, game_version: str, loader_version: str
@@ -228,34 +237,45 @@ class FabricMetaClient:
             f"/v2/versions/loader/{game_version}/{loader_version}/server/json"
         )
 
-        return parse_obj_as(dict, data)
+        return get_type_adapter(dict).validate_python(data)
 
 
 class FabricLibrariesBuilder:
+    __slots__ = ("profile",)
+
     def __init__(self, profile: Profile):
         self.profile = profile
 
     def build(self):
-        for pos, library in enumerate(self.profile.libraries[:]):  # type: int, Library
-            path = library.path.as_posix()
-
-            file_size = int(
-                requests.head(urljoin(library.url, library.path.as_posix())).headers[
-                    "Content-Length"
-                ]
+        # the HEAD and .sha1 requests of all libraries go out concurrently over
+        # the shared pool (16 connections per host)
+        session = http_session()
+        libraries = self.profile.libraries
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            downloads = executor.map(
+                lambda library: self.build_artifact_download(session, library),
+                libraries,
             )
+            for library, download in zip(libraries, downloads):
+                library.downloads = LibraryDownloads(artifact=download)
 
-            file_sha1 = requests.get(
-                urljoin(library.url, f"{library.path.as_posix()}.sha1")
-            ).content.decode(errors="replace")
-            if len(file_sha1) != 40 or not file_sha1.isalnum():
-                raise Exception(f"Invalid SHA1 {file_sha1[:80]!r}")
-
-            library.downloads = LibraryDownloads(
-                artifact=LibraryArtifactDownload(
-                    size=file_size,
-                    sha1=file_sha1,
-                    path=path,
-                    url=urljoin(library.url, path),
-                )
-            )
+    def build_artifact_download(
+        self, session: requests.Session, library: Library
+    ) -> LibraryArtifactDownload:
+        path = library.path.as_posix()
+
+        file_size = int(
+            session.head(urljoin(library.url, path)).headers["Content-Length"]
+        )
+
+        res = session.get(urljoin(library.url, f"{path}.sha1"))
+        file_sha1 = res.content.decode(errors="replace")
+        if len(file_sha1) != 40 or not file_sha1.isalnum():
+            raise Exception(f"Invalid SHA1 {file_sha1[:80]!r}")
+
+        return LibraryArtifactDownload(
+            size=file_size,
+            sha1=file_sha1,
+            path=path,
+            url=urljoin(library.url, path),
+        )
@@ -1,16 +1,19 @@
+import os
 import re
 import shutil
 import subprocess
 import traceback
 from collections import defaultdict
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from distutils.version import LooseVersion
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 from urllib.parse import ParseResult, urljoin, urlparse
 
-import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
 
 from ..profile import (
     InstallProfile,
@@ -21,7 +24,12 @@ from ..profile import (
     LibraryTextDependency,
     Profile,
 )
-from ..utils import is_file_in_jar, sha1_hexdigest
+from ..utils import (
+    copy_file,
+    http_session,
+    link_file,
+    sha1_hexdigest,
+)
 from ..utils import load_json_from_jar as in_jar
 from ..vanilla import fetch_vanilla_profile
 from ..versions import VersionRange
@@ -30,9 +38,20 @@ from .base import Provider
 VERSION_JSON = "version.json"
 INSTALL_JSON = "install_profile.json"
 
+# from 1.13 forge ships version.json in the installer and downloads in its profile
+FORGE_1_13 = LooseVersion("1.13")
+
+# times download_forge picks an interrupted download up from where it stopped
+DOWNLOAD_RESUMES = 3
+
 FORGE_MAVEN = "maven.minecraftforge.net"
 FORGE_URI = "net/minecraftforge/forge"
 
+# KEY=VALUE lines of settings.cfg; ";" starts a comment, trailing ";" are dropped
+SETTINGS_CFG_LINE = re.compile(
+    r"^[^\S\n]*+(?!;)([^=\n]*?)[^\S\n]*=[^\S\n]*(.*?)[^\S\n]*;*[^\S\n]*$", re.M
+)
+
 
 # (standard name, full name)
 # The former is used in Forge Maven URL path, and the latter is the name of a forge file.
@@ -56,15 +75,23 @@ SPECIFIC_VERSION_FORMS = {
 }
 
 
+# parsed once at import instead of on every lookup
+SPECIFIC_VERSION_RANGES = [
+    (VersionRange(version_range), form)
+    for version_range, form in SPECIFIC_VERSION_FORMS.items()
+]
+
+
+@lru_cache(maxsize=64)
 def get_forge_version_form(v: str) -> Form:
-    for version_range, form in SPECIFIC_VERSION_FORMS.items():
-        if v in VersionRange(version_range):
+    for version_range, form in SPECIFIC_VERSION_RANGES:
+        if v in version_range:
             return form
 
     return DEFAULT_VERSION_FORM
 
 
-@dataclass
+@dataclass(slots=True)
 class ForgeBase:
     mc_version: str
     forge_version: str
@@ -73,6 +100,21 @@ class ForgeBase:
 
     type: ForgeType
 
+    # derived from the fields above once, in __post_init__
+    standard_name: str = field(init=False, repr=False)
+    full_name: str = field(init=False, repr=False)
+    jar: Path = field(init=False, repr=False)
+    url: str = field(init=False, repr=False)
+    _universal: Optional[Path] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.standard_name = self.form.standard.replace(
+            "{mc}", self.mc_version
+        ).replace("{forge}", self.forge_version)
+        self.full_name = self.get_fullname_with(self.type)
+        self.jar = self.directory / f"{self.full_name}.jar"
+        self.url = f"https://{FORGE_MAVEN}/{FORGE_URI}/{self.standard_name}/{self.full_name}.jar"
+
     def get_fullname_with(self, _type: ForgeType):
         return (
             self.form.full.replace("{mc}", self.mc_version)
@@ -85,37 +127,32 @@ class ForgeBase:
         return self.mc_version
 
     @property
-    def standard_name(self):
-        return self.form.standard.replace("{mc}", self.mc_version).replace(
-            "{forge}", self.forge_version
-        )
+    def universal(self) -> Path:
+        if self._universal is None:
+            self._universal = self.find_universal()
 
-    @property
-    def full_name(self):
-        return self.get_fullname_with(self.type)
-
-    @property
-    def jar(self) -> Path:
-        return self.directory / f"{self.full_name}.jar"
+        return self._universal
 
-    @property
-    def universal(self):
-        std_file = self.directory / f"{self.standard_name}.jar"
-        if std_file.exists():
-            return std_file
-
-        univ_file = (
-            self.directory / f"{self.get_fullname_with(ForgeType.UNIVERSAL)}.jar"
+    def find_universal(self) -> Path:
+        # in order of preference
+        names = (
+            f"{self.standard_name}.jar",
+            f"{self.get_fullname_with(ForgeType.UNIVERSAL)}.jar",
         )
-        if univ_file.exists():
-            return univ_file
+        with os.scandir(self.directory) as it:
+            found = {entry.name for entry in it if entry.name in names}
+
+        for name in names:
+            if name in found:
+                return self.directory / name
 
         raise FileNotFoundError("Forge universal jar file has not been found.")
 
     def load_version(self):
-        if is_file_in_jar(self.universal, VERSION_JSON):
-            return Profile.from_json(in_jar(self.universal, VERSION_JSON))
-        else:
+        universal = self.universal
+        try:
+            return Profile.from_json(in_jar(universal, VERSION_JSON))
+        except FileNotFoundError:
             raise FileNotFoundError("Forge version profile json has not been found.")
 
     @property
@@ -137,12 +174,8 @@ class ForgeBase:
 
         return profile
 
-    @property
-    def url(self):
-        return f"https://{FORGE_MAVEN}/{FORGE_URI}/{self.standard_name}/{self.full_name}.jar"
-
 
-@dataclass
+@dataclass(slots=True)
 class ForgeInstaller(ForgeBase):
     type: ForgeType = ForgeType.INSTALLER
 
@@ -155,20 +188,47 @@ class ForgeInstaller(ForgeBase):
 
     def load_version(self):
         # From 1.13, Version.json is included in the installer jar.
-        if self.mc_version < LooseVersion("1.13"):
-            return super().load_version()
-        elif is_file_in_jar(self.jar, VERSION_JSON):
+        if self.mc_version < FORGE_1_13:
+            # zero-argument super() does not work in a slots=True dataclass
+            return ForgeBase.load_version(self)
+
+        try:
             return Profile.from_json(in_jar(self.jar, VERSION_JSON))
-        else:
+        except FileNotFoundError:
             raise FileNotFoundError("Forge version profile json has not been found.")
 
     def download_forge(self):
-        res = requests.get(self.url, stream=True)
-        res.raise_for_status()
-
-        with self.jar.open("wb") as fp:
-            for chunk in res:
-                fp.write(chunk)
+        # download into a .part file, resuming it when a previous run was interrupted
+        part = self.jar.with_name(f"{self.jar.name}.part")
+        # the session only retries up to the headers; a body cut off is resumed here
+        resumes = DOWNLOAD_RESUMES
+        while True:
+            offset = part.stat().st_size if part.exists() else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+            with http_session().get(self.url, stream=True, headers=headers) as res:
+                if res.status_code == 416 and offset:
+                    # the part is already complete, or longer than the file now is
+                    part.unlink()
+                    continue
+
+                res.raise_for_status()
+
+                res.raw.decode_content = True
+                try:
+                    with part.open("ab" if res.status_code == 206 else "wb") as fp:
+                        # a read cut off mid-chunk is lost, so chunks stay small
+                        shutil.copyfileobj(res.raw, fp, length=1 << 16)
+                except (ProtocolError, ReadTimeoutError):
+                    if resumes == 0:
+                        raise
+
+                    resumes -= 1
+                    continue
+
+            break
+
+        part.replace(self.jar)
 
     def install(self, *, auto_download=True, side="server"):
         if auto_download and not self.jar.exists():
@@ -193,10 +253,13 @@ def find_forge_version_in_path(path: Path) -> Optional[str]:
 
     if not version:
         found = set()
-        for file in path.glob("forge-*.jar"):
-            m = re.match("^forge-(.*?).jar$", file.name)
-            if m:
-                ver = m[1]
+        with os.scandir(path) as it:
+            for entry in it:
+                name = entry.name
+                if not (name.startswith("forge-") and name.endswith(".jar")):
+                    continue
+
+                ver = name[len("forge-") : -len(".jar")]
                 if ver.endswith(("-installer", "-universal")):
                     ver = ver.rpartition("-")[0]
 
@@ -308,15 +371,18 @@ def is_forge_universal(library: Library):
 
 
 class ForgeLibrariesBuilder:
+    __slots__ = ("profile", "folder", "forge_base")
+
     def __init__(self, profile: Profile, folder: Path, forge_base: ForgeBase = None):
         self.profile = profile
         self.folder = folder
         self.forge_base = forge_base
 
     def check_source(self):
+        libraries_folder = self.folder / "libraries"
         for library in self.profile.libraries:
             if library.clientreq or library.serverreq:
-                lib = self.folder / "libraries" / library.path
+                lib = libraries_folder / library.path
                 assert lib.exists(), lib
             elif library.downloads:
                 assert library.downloads.artifact or library.downloads.classifiers
@@ -324,13 +390,23 @@ class ForgeLibrariesBuilder:
                 assert is_forge_universal(library), library
 
     def check_all_forge_jars(self, path: Path):
-        universal_jar = path.with_stem(f"{path.stem}-universal")
-        server_jar = path.with_stem(f"{path.stem}-server")
-        client_jar = path.with_stem(f"{path.stem}-client")
+        stem, suffix = path.stem, path.suffix
+        universal_jar = f"{stem}-universal{suffix}"
+        server_jar = f"{stem}-server{suffix}"
+        client_jar = f"{stem}-client{suffix}"
+
+        # one directory listing instead of a stat per jar
+        try:
+            with os.scandir(path.parent) as it:
+                names = {entry.name for entry in it}
+        except FileNotFoundError:
+            return False
 
-        if universal_jar.exists() and server_jar.exists():
-            if not client_jar.exists():
-                raise Exception(f"client jar file is missing: {client_jar}")
+        if universal_jar in names and server_jar in names:
+            if client_jar not in names:
+                raise Exception(
+                    f"client jar file is missing: {path.with_name(client_jar)}"
+                )
 
             return True
         else:
@@ -351,6 +427,7 @@ class ForgeLibrariesBuilder:
         forge_short_version = install_profile.version.replace("forge-", "")
 
         libraries_folder = self.folder / "libraries"
+        base_url = urljoin(url, ".")
 
         self.profile.libraries.extend(install_profile.libraries)
 
@@ -374,7 +451,7 @@ class ForgeLibrariesBuilder:
                 library = Library(
                     name=":".join(filter(None, dependency)),
                     clientreq=True,
-                    downloads=self.build_artifact_download(file, path, url),
+                    downloads=self.build_artifact_download(file, path, base_url),
                     _dependency=dependency,
                 )
 
@@ -403,7 +480,7 @@ class ForgeLibrariesBuilder:
                 library = Library(
                     name=":".join(filter(None, dependency)),
                     clientreq=True,
-                    downloads=self.build_artifact_download(file, path, url),
+                    downloads=self.build_artifact_download(file, path, base_url),
                     _dependency=dependency,
                 )
 
@@ -426,7 +503,14 @@ class ForgeLibrariesBuilder:
 
         self.profile.libraries[:] = selected_libraries
 
-    def build(self, url: str, target_libraries_folder: Path, *, copy: bool):
+    def build(
+        self,
+        url: str,
+        target_libraries_folder: Path,
+        *,
+        copy: bool,
+        link: bool = False,
+    ):
         self.check_source()
         self.normalize()
 
@@ -435,59 +519,118 @@ class ForgeLibrariesBuilder:
             raise Exception(f"protocol {up.scheme!r} is not supported")
 
         libraries_folder = self.folder / "libraries"
-        for pos, library in enumerate(self.profile.libraries[:]):
-            file = libraries_folder / library.path
-            path = file.relative_to(libraries_folder)
+        base_url = urljoin(url, ".")
+
+        # (library, file, path) to hash and copy once the library list is final
+        jobs: list[tuple[Library, Path, Path]] = []
+        libraries: list[Library] = []
+        for library in self.profile.libraries:
+            pos = len(libraries)
+            libraries.append(library)
+
+            path = library.path
+            file = libraries_folder / path
 
             if library.clientreq or library.serverreq:
-                if library.version < LooseVersion("1.13"):
+                if library.version < FORGE_1_13:
                     assert not library.downloads
-            elif is_forge_universal(library) and library.version < LooseVersion("1.13"):
+            elif is_forge_universal(library) and library.version < FORGE_1_13:
                 if self.check_all_forge_jars(file):
                     for tag in "universal", "client":
-                        sfile = file.with_stem(f"{file.stem}-{tag}")
-                        spath = path.with_stem(f"{file.stem}-{tag}")
+                        name = f"{file.stem}-{tag}{file.suffix}"
+                        sfile = file.with_name(name)
+                        spath = path.with_name(name)
                         assert sfile.exists(), sfile
 
-                        download = self.build_artifact_download(sfile, spath, url)
-
-                        if copy:
-                            self.copy_library_file(
-                                sfile, spath, target_libraries_folder
-                            )
-
                         new_library = Library(
                             name=f"{library.name}-{tag}",
-                            downloads=LibraryDownloads(artifact=download),
                             _dependency=library._dependency.replace(tag=tag),
                         )
-                        self.profile.libraries.insert(pos + 1, new_library)
+                        libraries.insert(pos + 1, new_library)
+                        jobs.append((new_library, sfile, spath))
                 else:
                     file = self.forge_base.universal
             else:
                 continue
 
             assert file.exists(), file
+            jobs.append((library, file, path))
+
+        self.profile.libraries[:] = libraries
+
+        # hashing and copying release the GIL, so the jars are processed in parallel
+        target = target_libraries_folder if copy else None
+        with ThreadPoolExecutor() as executor:
+            downloads = executor.map(
+                lambda job: self.build_library_file(
+                    job[1], job[2], base_url, target, link, job[0].downloads
+                ),
+                jobs,
+            )
+            for (library, _, _), download in zip(jobs, downloads):
+                library.downloads = LibraryDownloads(artifact=download)
+
+    def build_library_file(
+        self,
+        file: Path,
+        path: Path,
+        base_url: str,
+        target_libraries_folder: Optional[Path],
+        link: bool = False,
+        known: Optional[LibraryDownloads] = None,
+    ) -> LibraryArtifactDownload:
+        download = self.build_artifact_download(file, path, base_url, known)
 
-            download = self.build_artifact_download(file, path, url)
-            library.downloads = LibraryDownloads(artifact=download)
+        if target_libraries_folder is not None:
+            self.copy_library_file(file, path, target_libraries_folder, link=link)
 
-            if copy:
-                self.copy_library_file(file, path, target_libraries_folder)
+        return download
+
+    def build_artifact_download(
+        self,
+        file: Path,
+        path: Path,
+        base_url: str,
+        known: Optional[LibraryDownloads] = None,
+    ):
+        # base_url is urljoin(url, "."), so appending equals urljoin(url, posix_path)
+        posix_path = path.as_posix()
+        size = file.stat().st_size
+
+        # libraries added by update_from_install_profile were hashed moments ago
+        artifact = known.artifact if known else None
+        if (
+            artifact is not None
+            and artifact.sha1
+            and artifact.size == size
+            and artifact.path == posix_path
+        ):
+            sha1 = artifact.sha1
+        else:
+            sha1 = sha1_hexdigest(file)
 
-    def build_artifact_download(self, file: Path, path: Path, url):
         return LibraryArtifactDownload(
-            size=file.stat().st_size,
-            sha1=sha1_hexdigest(file),
-            path=path.as_posix(),
-            url=urljoin(url, path.as_posix()),
+            size=size,
+            sha1=sha1,
+            path=posix_path,
+            url=base_url + posix_path,
         )
 
-    def copy_library_file(self, file: Path, path: Path, target_libraries_folder: Path):
+    def copy_library_file(
+        self,
+        file: Path,
+        path: Path,
+        target_libraries_folder: Path,
+        *,
+        link: bool = False,
+    ):
         target = target_libraries_folder / path
-        target.parent.mkdir(parents=True, exist_ok=True)
         if not target.exists():
-            shutil.copyfile(str(file.absolute()), str(target.absolute()))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if link:
+                link_file(file, target)
+            else:
+                copy_file(file, target)
 
     def check_target(self, target_libraries_folder: Path) -> bool:
         success = True
@@ -503,17 +646,5 @@ class ForgeLibrariesBuilder:
 
 
 def read_settings_cfg(settings_cfg_path: Path):
-    with settings_cfg_path.open() as fp:
-        for line in fp:
-            line = line.strip()
-            if line.startswith(";"):
-                continue
-
-            line = line.rstrip(";")
-            key, sep, value = line.partition("=")
-            if not sep:
-                continue
-
-            key = key.strip()
-            value = value.strip()
-            yield key, value
+    for m in SETTINGS_CFG_LINE.finditer(settings_cfg_path.read_text()):
+        yield m[1], m[2]
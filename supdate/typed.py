@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-import json
 from collections.abc import MutableMapping
 from dataclasses import MISSING, Field, dataclass, fields, is_dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Type, Union, get_type_hints
+from typing import Any, Dict, List, Optional, Type, Union, get_type_hints
 
 from typing_inspect import get_args, get_origin, is_optional_type
 
+from .utils import atomic_write_bytes, json_dumps, json_loads
+
 
 def get_optional(tp: Type):
     if is_optional_type(tp):
@@ -19,15 +21,67 @@ def get_optional(tp: Type):
                 return t
 
 
+def is_namespace(tp) -> bool:
+    return is_dataclass(tp) and issubclass(tp, Namespace)
+
+
+NAMESPACE = "namespace"
+NAMESPACE_LIST = "namespace_list"
+NAMESPACE_DICT = "namespace_dict"
+
+
+# (name, required, kind, namespace type, cast to int) for each field of a class;
+# resolving type hints is far slower than decoding the values themselves
+@lru_cache(maxsize=None)
+def get_schema(
+    cls: Type[Namespace],
+) -> list[tuple[str, bool, Optional[str], Any, bool]]:
+    schema = []
+
+    hints = get_type_hints(cls)
+    for field in fields(cls):  # type: Field
+        required = field.default is MISSING and field.default_factory is MISSING
+
+        tp = hints.get(field.name, field.type)
+        tp = get_optional(tp) or tp
+        origin = get_origin(tp)
+
+        kind = None
+        if is_namespace(tp):
+            kind = NAMESPACE
+        elif origin in (list, List):
+            (tp,) = get_args(tp)
+            if is_namespace(tp):
+                kind = NAMESPACE_LIST
+        elif origin in (dict, Dict):
+            tk, tp = get_args(tp)
+            assert tk == str
+            if is_namespace(tp):
+                kind = NAMESPACE_DICT
+
+        schema.append((field.name, required, kind, tp, field.type == "int"))
+
+    return schema
+
+
+@lru_cache(maxsize=None)
+def get_field_names(cls: Type[Namespace]) -> frozenset[str]:
+    return frozenset(field.name for field in fields(cls))
+
+
+@lru_cache(maxsize=None)
+def get_defaults(cls: Type[Namespace]) -> dict[str, Any]:
+    return {
+        field.name: field.default
+        for field in fields(cls)
+        if field.default is not MISSING
+    }
+
+
 @dataclass(repr=False)
 class Namespace(MutableMapping):
     def __iter__(self):
-        defaults = {
-            field.name: field.default
-            for field in fields(self)
-            if field.default is not MISSING
-        }
-
+        defaults = get_defaults(type(self))
         for key, value in self.__dict__.items():
             if key.startswith("_"):
                 continue
@@ -57,49 +111,42 @@ class Namespace(MutableMapping):
 
     @classmethod
     def from_json(cls, data: dict):
-        data = data.copy()
         values = {}
 
-        hints = get_type_hints(cls)
-        for field in fields(cls):  # type: Field
-            if field.default is not MISSING or field.default_factory is not MISSING:
-                value = data.pop(field.name, MISSING)
+        # data is only read; keys that are not fields are copied over at the end
+        for name, required, kind, tp, cast_int in get_schema(cls):
+            if required:
+                value = data[name]
+            else:
+                value = data.get(name, MISSING)
                 if value is MISSING:
                     continue
-            else:
-                value = data.pop(field.name)
-
-            tp = hints.get(field.name, field.type)
-            tp = get_optional(tp) or tp
-            origin = get_origin(tp)
 
-            if is_dataclass(tp) and issubclass(tp, Namespace):
+            if kind is NAMESPACE:
                 value = tp.from_json(value)
-            elif origin in (list, List):
-                (tp,) = get_args(tp)
-                if is_dataclass(tp) and issubclass(tp, Namespace):
-                    assert isinstance(value, list)
-                    value = [tp.from_json(item) for item in value]
-            elif origin in (dict, Dict):
-                tk, tv = get_args(tp)
-                assert tk == str
-                if is_dataclass(tv) and issubclass(tv, Namespace):
-                    assert isinstance(value, dict)
-                    value = {key: tv.from_json(value) for key, value in value.items()}
+            elif kind is NAMESPACE_LIST:
+                assert isinstance(value, list)
+                value = [tp.from_json(item) for item in value]
+            elif kind is NAMESPACE_DICT:
+                assert isinstance(value, dict)
+                value = {key: tp.from_json(value) for key, value in value.items()}
             # Forced to cast a type because of wrong floats
-            if field.type == "int":
+            if cast_int:
                 value = int(value)
 
-            values[field.name] = value
+            values[name] = value
 
         # noinspection PyArgumentList
         obj = cls(**values)
-        obj.__dict__.update(data)
+        if len(data) > len(values):
+            names = get_field_names(cls)
+            obj.__dict__.update(
+                (key, value) for key, value in data.items() if key not in names
+            )
+
         return obj
 
     def to_json(self) -> dict:
-        fids = {field.name: field for field in fields(self)}
-
         def visit(obj):
             if isinstance(obj, Namespace):
                 return obj.to_json()
@@ -110,26 +157,18 @@ class Namespace(MutableMapping):
             else:
                 return obj
 
-        result = {}
-        for key, value in self.items():
-            field: Optional[Field] = fids.get(key)
-            if field is not None:
-                if field.default == value:
-                    continue
-
-            result[key] = visit(value)
+        # __iter__ already leaves out private keys and fields at their default
+        return {key: visit(getattr(self, key)) for key in self}
 
-        return result
+    def dumps(self) -> bytes:
+        return json_dumps(self.to_json())
 
     def write_to_path(self, path: Path):
-        obj = self.to_json()
-        s = json.dumps(obj, indent=4, sort_keys=False)
-        path.write_text(s, encoding="utf-8")
+        atomic_write_bytes(path, self.dumps())
 
     @classmethod
     def read_from_path(cls, path: Path):
-        s = path.read_text(encoding="utf-8")
-        obj = json.loads(s)
+        obj = json_loads(path.read_bytes())
         return cls.from_json(obj)
 
     def __repr__(self):
@@ -1,37 +1,270 @@
+from __future__ import annotations
+
+import errno
 import json
+import mmap
+import os
+import re
+import shutil
+from functools import cache, lru_cache
+from hashlib import file_digest
 from hashlib import sha1 as _sha1
 from pathlib import Path
+from typing import Iterable, Iterator, Optional
 from zipfile import ZipFile
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
-def load_json_from_jar(jar: Path, filename: str) -> dict:
-    with ZipFile(jar) as zf:
-        try:
-            fp = zf.open(filename)
-        except KeyError:
-            raise FileNotFoundError(f"{filename} does not exist in {jar.absolute()}!")
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+
+    def json_loads(data: bytes | str):
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+else:
+
+    def json_loads(data: bytes | str):
+        return json.loads(data)
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    # readers never see a half-written file, even if we are interrupted
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
 
-        with fp:
-            content = fp.read().decode("utf-8")
-            return json.loads(content)
 
+@cache
+def http_session() -> requests.Session:
+    # created on first use, so it picks up requests_cache.install_cache() from cli()
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.3),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-def is_file_in_jar(jar: Path, filename: str) -> bool:
+
+@lru_cache(maxsize=16)
+def _read_json_entries(jar: str, mtime_ns: int, size: int) -> dict[str, bytes]:
+    # every top-level *.json (version.json, install_profile.json, ...) in one open;
+    # keyed by mtime and size so a rewritten jar is read again
     with ZipFile(jar) as zf:
-        return filename in zf.namelist()
+        return {
+            info.filename: zf.read(info)
+            for info in zf.infolist()
+            if "/" not in info.filename and info.filename.endswith(".json")
+        }
+
+
+def load_json_from_jar(jar: Path, filename: str) -> dict:
+    # bytes are cached rather than the parsed dict, which callers mutate
+    try:
+        if "/" not in filename and filename.endswith(".json"):
+            st = jar.stat()
+            entries = _read_json_entries(str(jar), st.st_mtime_ns, st.st_size)
+            content = entries[filename]
+        else:
+            with ZipFile(jar) as zf:
+                content = zf.read(filename)
+    except KeyError:
+        raise FileNotFoundError(f"{filename} does not exist in {jar}!")
+
+    return json_loads(content)
+
+
+MMAP_HASH_THRESHOLD = 16 << 20
 
 
 def sha1_hexdigest(file: Path):
-    if not file.exists():
-        raise FileNotFoundError(str(file))
-    elif not file.is_file():
+    # unbuffered: file_digest reads straight into its own reusable buffer
+    try:
+        fp = file.open("rb", buffering=0)
+    except IsADirectoryError:
         raise FileExistsError((str(file)), "is not a file.")
 
-    return _sha1(file.read_bytes()).hexdigest()
+    with fp:
+        if os.fstat(fp.fileno()).st_size >= MMAP_HASH_THRESHOLD:
+            # large files are hashed straight from the page cache, without a copy
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+
+                return _sha1(mm).hexdigest()
+
+        if hasattr(os, "posix_fadvise"):
+            # read front to back once: let the kernel read ahead more aggressively
+            os.posix_fadvise(fp.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        return file_digest(fp, "sha1").hexdigest()
+
+
+class HashCache:
+    # path -> [size, mtime_ns, sha1]; only entries looked up again are written back
+    def __init__(self, entries: Optional[dict] = None):
+        self.entries = entries or {}
+        self.used = {}
+
+    @classmethod
+    def read_from_path(cls, path: Path) -> HashCache:
+        try:
+            return cls(json_loads(path.read_bytes()))
+        except (FileNotFoundError, ValueError):
+            return cls()
+
+    def write_to_path(self, path: Path):
+        atomic_write_bytes(path, json_dumps(self.used))
+
+    def sha1_hexdigest(self, file: Path, st: Optional[os.stat_result] = None) -> str:
+        if st is None:
+            st = file.stat()
+
+        key = str(file)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+            entry = [st.st_size, st.st_mtime_ns, sha1_hexdigest(file)]
+
+        self.used[key] = entry
+        return entry[2]
+
+    def update(self, file: Path, sha1: str):
+        # record a hash already known, e.g. of a file that was just copied
+        st = file.stat()
+        self.used[str(file)] = [st.st_size, st.st_mtime_ns, sha1]
+
+
+def copy_file(src: Path, dst: Path):
+    # in-kernel copy, which can reflink on btrfs/XFS; shutil falls back to sendfile
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+            return
+        except OSError:
+            pass
+
+    shutil.copyfile(src, dst)
+
+
+# other filesystem, too many links, or links are not supported or allowed there
+LINK_FALLBACK_ERRNOS = frozenset(
+    (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.ENOSYS)
+)
+
+
+def link_file(src: Path, dst: Path):
+    # the target shares the inode, so src must not be rewritten in place afterwards
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        # linked or copied already, e.g. by another worker; copying over it could
+        # truncate the inode it shares with src
+        pass
+    except OSError as e:
+        if e.errno not in LINK_FALLBACK_ERRNOS:
+            raise
+
+        copy_file(src, dst)
+
+
+def translate_glob(pattern: str) -> str:
+    # pathlib semantics: "**" spans directories, "*" and "?" stay in a segment
+    parts = []
+    for segment in pattern.split("/"):
+        if segment == "**":
+            parts.append("(?:[^/]+/)*")
+            continue
+
+        res = []
+        i, n = 0, len(segment)
+        while i < n:
+            c = segment[i]
+            i += 1
+            if c == "*":
+                res.append("[^/]*")
+            elif c == "?":
+                res.append("[^/]")
+            elif c == "[":
+                j = i
+                if j < n and segment[j] == "!":
+                    j += 1
+                if j < n and segment[j] == "]":
+                    j += 1
+                j = segment.find("]", j)
+                if j < 0:
+                    res.append("\\[")
+                else:
+                    # escaped like fnmatch does, so re never sees a nested set or
+                    # a set operation
+                    stuff = segment[i:j].replace("\\", "\\\\").replace("[", "\\[")
+                    stuff = re.sub(r"([&~|])", r"\\\1", stuff)
+                    if stuff.startswith("!"):
+                        stuff = "^" + stuff[1:]
+                    elif stuff.startswith("^"):
+                        stuff = "\\" + stuff
+                    res.append(f"[{stuff}]")
+                    i = j + 1
+            else:
+                res.append(re.escape(c))
+
+        parts.append("".join(res) + "/")
+
+    return "".join(parts).removesuffix("/")
+
+
+def glob_roots(patterns: Iterable[str]) -> list[str]:
+    # literal leading directories of each pattern, without the ones nested in another
+    roots = []
+    for pattern in patterns:
+        segments = pattern.split("/")[:-1]
+        for pos, segment in enumerate(segments):
+            if any(c in segment for c in "*?["):
+                segments = segments[:pos]
+                break
+
+        roots.append("".join(f"{segment}/" for segment in segments))
+
+    return [
+        root
+        for pos, root in enumerate(roots)
+        if not any(
+            root.startswith(other) and (root != other or other_pos < pos)
+            for other_pos, other in enumerate(roots)
+            if other_pos != pos
+        )
+    ]
+
 
+def compile_globs(patterns: Iterable[str]) -> re.Pattern:
+    regex = "|".join(f"(?:{translate_glob(pattern)})" for pattern in patterns)
+    return re.compile(f"(?s:{regex or '(?!)'})\\Z")
 
-def is_same_file(a: Path, b: Path):
-    if not a.exists() or not b.exists():
-        return False
 
-    return sha1_hexdigest(a) == sha1_hexdigest(b)
+def iter_files(folder: Path, prefix: str = "") -> Iterator[tuple[Path, str]]:
+    stack = [(os.path.join(folder, prefix), prefix)]
+    while stack:
+        dirname, prefix = stack.pop()
+        with os.scandir(dirname) as it:
+            for entry in it:
+                # like pathlib's "**", symlinked directories are not descended into
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, f"{prefix}{entry.name}/"))
+                elif entry.is_file():
+                    yield Path(entry.path), f"{prefix}{entry.name}"
@@ -1,10 +1,10 @@
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any, List
 
-import requests
-
 from .profile import Profile
 from .typed import Namespace
+from .utils import http_session, json_loads
 
 
 @dataclass(repr=False)
@@ -16,7 +16,7 @@ class VanillaVersion(Namespace):
     releaseTime: str
 
     def fetch(self):
-        return Profile.from_json(requests.get(self.url).json())
+        return Profile.from_json(json_loads(http_session().get(self.url).content))
 
 
 @dataclass(repr=False)
@@ -40,9 +40,15 @@ class VanillaVersionManifest(Namespace):
 
     @classmethod
     def fetch(cls):
-        return cls.from_json(requests.get(cls.URL).json())
+        return cls.from_json(json_loads(http_session().get(cls.URL).content))
 
 
-def fetch_vanilla_profile(vanilla_version: str) -> Profile:
+@lru_cache(maxsize=32)
+def fetch_vanilla_profile_json(vanilla_version: str) -> bytes:
     vanilla_manifest = VanillaVersionManifest.fetch()
-    return vanilla_manifest[vanilla_version].fetch()
+    return http_session().get(vanilla_manifest[vanilla_version].url).content
+
+
+def fetch_vanilla_profile(vanilla_version: str) -> Profile:
+    # parsed on every call: callers merge into the returned profile
+    return Profile.from_json(json_loads(fetch_vanilla_profile_json(vanilla_version)))
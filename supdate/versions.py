@@ -1,43 +1,37 @@
+import re
 from datetime import datetime
 from distutils.version import LooseVersion
-from typing import List, Optional, Union
+from typing import Optional, Union
+
+# "[left, right)"; bounds keep the text between the bracket and the comma as is,
+# apart from the whitespace around the comma
+VERSION_RANGE_PATTERN = re.compile(r"\s*([\[(])([^,]*?)\s*,\s*([^,]*)([\])])\s*")
 
 
 class VersionRange:
+    # private names in __slots__ are mangled like the attributes themselves
+    __slots__ = ("__left", "__right", "__lopen", "__ropen", "__empty")
+
     def __init__(self, vrange: str):
-        versions: List[str] = list(map(lambda v: v.strip(), vrange.split(",")))
-        if len(versions) != 2:
-            raise ValueError(f"{vrange} is not a valid version range.")
-        elif all(
-            (
-                versions[0][0] == "[" or versions[0][0] == "(",
-                versions[1][-1] == "]" or versions[1][-1] == ")",
-            )
-        ):
-            if len(versions[0][1:]) == 0 or versions[0] == "*":
-                self.__left = None
-            else:
-                self.__left = LooseVersion(versions[0][1:])
-
-            if len(versions[1][:-1]) == 0 or versions[1] == "*":
-                self.__right = None
-            else:
-                self.__right = LooseVersion(versions[1][:-1])
-
-            self.__lopen = versions[0][0] == "("
-            self.__ropen = versions[1][-1] == ")"
-            self.__empty = all(
-                (
-                    self.__left is None,
-                    self.__right is None,
-                    (self.__lopen or self.__ropen),
-                )
-            )
-        else:
+        match = VERSION_RANGE_PATTERN.fullmatch(vrange)
+        if match is None:
+            if vrange.count(",") != 1:
+                raise ValueError(f"{vrange} is not a valid version range.")
             raise ValueError(
                 "The range must be given by the form of mathematical intervals."
             )
 
+        lbracket, left, right, rbracket = match.groups()
+        self.__left = None if left in ("", "*") else LooseVersion(left)
+        self.__right = None if right in ("", "*") else LooseVersion(right)
+        self.__lopen = lbracket == "("
+        self.__ropen = rbracket == ")"
+        self.__empty = (
+            self.__left is None
+            and self.__right is None
+            and (self.__lopen or self.__ropen)
+        )
+
     @property
     def left(self):
         return self.__left
@@ -62,14 +56,38 @@ class VersionRange:
     def rclosed(self):
         return not self.__ropen
 
+    def __key(self):
+        # LooseVersion is unhashable, its parsed components are what it compares
+        return (
+            None if self.__left is None else tuple(self.__left.version),
+            None if self.__right is None else tuple(self.__right.version),
+            self.__lopen,
+            self.__ropen,
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, VersionRange):
+            return NotImplemented
+
+        return self.__key() == other.__key()
+
+    def __hash__(self):
+        return hash(self.__key())
+
     def __contains__(self, item: Union[LooseVersion, str]):
         if self.__empty:
             return False
-        if self.left is not None:
-            if (item < self.left) or (self.lopen and item == self.left):
+
+        # each comparison with a str would parse it again
+        if isinstance(item, str):
+            item = LooseVersion(item)
+
+        left, right = self.__left, self.__right
+        if left is not None:
+            if (item < left) or (self.__lopen and item == left):
                 return False
-        if self.right is not None:
-            if (item > self.right) or (self.ropen and item == self.right):
+        if right is not None:
+            if (item > right) or (self.__ropen and item == right):
                 return False
 
         return True